@@ -19,6 +19,7 @@ from __future__ import print_function
 
 import itertools
 import numbers
+import re
 
 import six
 
@@ -102,6 +103,20 @@ __intro_message__ = """
 ******************************************************************************
 """
 
+# lattice parameter names accepted by PdfFit.lat()
+_lat_params = { 'a':1, 'b':2, 'c':3, 'alpha':4, 'beta':5, 'gamma':6 }
+
+# public PdfFit attributes that are not exported by PdfFit._exportAll()
+_export_excluded = frozenset(['selalias', 'FCON', 'Sctp'])
+
+# engine functions for variable references shared by all PdfFit instances,
+# map variable name or scalar variable method to pdffit2 function.
+# Keys are never indexed references such as "x(1)", so the size is bounded.
+_ref_cache = {}
+
+# intro message lines that need to be padded or trimmed to the frame width
+_rx_intro_line = re.compile('(?m)^(.{1,77}|.{79}.*)$')
+
 
 ##############################################################################
 
@@ -109,6 +124,9 @@ __intro_message__ = """
 class PdfFit(object):
     """Create PdfFit object."""
 
+    __slots__ = ('_stru_files', '_data_files', 'finished', '_handle',
+                 '__weakref__')
+
     # constants and enumerators from pdffit.h:
     # selection of all atoms
     selalias = { 'ALL' : -1 }
@@ -116,6 +134,8 @@ class PdfFit(object):
     FCON = { 'USER' : 0, 'IDENT' : 1, 'FCOMP' : 2, 'FSQR' : 3 }
     # scattering type identifiers
     Sctp = { 'X' : 0, 'N' : 1 }
+    # engine constructor resolved once for all instances
+    _create = staticmethod(pdffit2.create)
 
     def _exportAll(self, namespace):
         """ _exportAll(self, namespace) --> Export all 'public' class methods
@@ -128,24 +148,27 @@ class PdfFit(object):
         """
         # string aliases (var = "var")
         for a in itertools.chain(self.selalias, self.FCON, self.Sctp):
-            exec("%s = %r" % (a, a), namespace)
-        public = [ a for a in dir(self) if "__" not in a and a not in
-                ["_handle", "_exportAll", "selalias", "FCON", "Sctp" ] ]
+            namespace[a] = a
+        public = [ a for a in dir(self) if not a.startswith('_') and a not in
+                _export_excluded ]
         for funcname in public:
-            namespace[funcname] = getattr(self, funcname)
+            # skip slots that are not assigned yet, e.g., finished
+            try:
+                namespace[funcname] = getattr(self, funcname)
+            except AttributeError:
+                pass
         return
 
     def intro():
         """Show introductory message.
         """
-        import re
         from diffpy.pdffit2 import __version__, __date__
         date = __date__[:10]
         d = {'version' : __version__,  'date' : date,
              'year' : date[:4] or '2019'}
         msg = __intro_message__ % d
         filler = lambda mx : (mx.group(0).rstrip(' *').ljust(77) + '*')
-        msg_ljust = re.sub('(?m)^(.{1,77}|.{79}.*)$', filler, msg)
+        msg_ljust = _rx_intro_line.sub(filler, msg)
         print(msg_ljust, file=output.stdout)
         return
     intro = staticmethod(intro)
@@ -215,6 +238,37 @@ class PdfFit(object):
         return
 
 
+    def read_many_data(self, files, stype, qmax, qdamp):
+        """read_many_data(files, stype, qmax, qdamp) --> Read pdf data from
+        several files into memory.
+
+        files   -- sequence of data file names or a single file name
+        stype   -- 'X' (xray) or 'N' (neutron)
+        qmax    -- Q-value cutoff used in PDF calculation.
+                   Use qmax=0 to neglect termination ripples.
+        qdamp   -- instrumental Q-resolution factor
+
+        Raises:
+            IOError when a file cannot be read from disk
+            pdffit2.dataError when a file has invalid data
+        In both cases the files before the failing one stay loaded
+        and are recorded in data_files.
+
+        Return list of loaded file names.
+        """
+        if isinstance(files, six.string_types):
+            files = [files]
+        files = list(files)
+        nset0 = self.num_datasets()
+        try:
+            pdffit2.read_many_data(self._handle, files, six.b(stype),
+                    qmax, qdamp)
+        finally:
+            loaded = files[:self.num_datasets() - nset0]
+            self.data_files.extend(loaded)
+        return loaded
+
+
     def read_data_string(self, data, stype, qmax, qdamp, name=""):
         """read_data_string(data, stype, qmax, qdamp, name = "") --> Read
         pdf data from a string into memory.
@@ -238,7 +292,8 @@ class PdfFit(object):
         """read_data_lists(stype, qmax, qdamp, r_data, Gr_data, dGr_data =
         None, name = "list") --> Read pdf data into memory from lists.
 
-        All lists must be of the same length.
+        All lists must be of the same length.  Any sequence of floats
+        can be used, arrays of doubles are copied directly.
         stype       -- 'X' (xray) or 'N' (neutron)
         qmax        -- Q-value cutoff used in PDF calculation.
                        Use qmax=0 to neglect termination ripples.
@@ -249,6 +304,7 @@ class PdfFit(object):
         name        -- tag with which to label data
 
         Raises: ValueError when the data lists are of different length
+                TypeError when the data are not sequences of floats
         """
         pdffit2.read_data_arrays(self._handle, six.b(stype), qmax, qdamp,
                 r_data, Gr_data, dGr_data, name)
@@ -271,8 +327,8 @@ class PdfFit(object):
 
     def reset(self):
         """reset() --> Clear all stored fit, structure, and parameter data."""
-        self.stru_files = []
-        self.data_files = []
+        self._stru_files = None
+        self._data_files = None
         pdffit2.reset(self._handle);
         return
 
@@ -316,10 +372,13 @@ class PdfFit(object):
         return
 
 
-    def refine(self, toler=0.00000001):
-        """refine(toler = 0.00000001) --> Fit the theory to the imported data.
+    def refine(self, toler=0.00000001, callback=None):
+        """refine(toler = 0.00000001, callback = None) --> Fit the theory
+        to the imported data.
 
         toler   --  tolerance of the fit
+        callback -- optional function callback(step, finished), which is
+                    called after every refinement step
 
         Raises:
             pdffit2.calculationError when the model pdf cannot be calculated
@@ -328,11 +387,7 @@ class PdfFit(object):
             pdffit2.unassigedError when a constraint used but never initialized
             using setpar()
         """
-        step = 0
-        finished = 0
-        while not finished:
-            finished = pdffit2.refine_step(self._handle, toler)
-            step += 1
+        pdffit2.refine(self._handle, toler, callback)
         return
 
 
@@ -354,16 +409,23 @@ class PdfFit(object):
         return self.finished
 
 
-    def save_pdf(self, iset, fname):
-        """save_pdf(iset, fname) --> Save calculated or fitted PDF to file.
+    def save_pdf(self, iset, fname, return_string=False):
+        """save_pdf(iset, fname, return_string=False) --> Save calculated or
+        fitted PDF to file.
 
         iset    -- data set to save
+        return_string -- when True, also return contents of the save file
 
         Raises:
             IOError if file cannot be saved
             pdffit2.unassignedError if the data set is undefined
+
+        Returns: string containing contents of save file when
+        return_string is True, otherwise None
         """
-        pdffit2.save_pdf(self._handle, iset, fname)
+        pdffilestring = pdffit2.save_pdf(self._handle, iset, fname)
+        if return_string:
+            return pdffilestring
         return
 
 
@@ -381,17 +443,23 @@ class PdfFit(object):
         return pdffilestring
 
 
-    def save_dif(self, iset, fname):
-        """save_dif(iset, fname) --> Save data and fitted PDF difference to
-        file.
+    def save_dif(self, iset, fname, return_string=False):
+        """save_dif(iset, fname, return_string=False) --> Save data and
+        fitted PDF difference to file.
 
         iset    -- data set to save
+        return_string -- when True, also return contents of the save file
 
         Raises:
             IOError if file cannot be saved
             pdffit2.unassignedError if the data set is undefined
+
+        Returns: string containing contents of save file when
+        return_string is True, otherwise None
         """
-        pdffit2.save_dif(self._handle, iset, fname)
+        diffilestring = pdffit2.save_dif(self._handle, iset, fname)
+        if return_string:
+            return diffilestring
         return
 
 
@@ -410,14 +478,22 @@ class PdfFit(object):
         return diffilestring
 
 
-    def save_res(self, fname):
-        """save_res(fname) --> Save fit-specific data to file.
+    def save_res(self, fname, return_string=False):
+        """save_res(fname, return_string=False) --> Save fit-specific data
+        to file.
+
+        return_string -- when True, also return contents of the save file
 
         Raises:
             IOError if file cannot be saved
             pdffit2.unassignedError if there is no refinement data to save
+
+        Returns: string containing contents of save file when
+        return_string is True, otherwise None
         """
-        pdffit2.save_res(self._handle, fname)
+        resfilestring = pdffit2.save_res(self._handle, fname)
+        if return_string:
+            return resfilestring
         return
 
 
@@ -448,17 +524,23 @@ class PdfFit(object):
         return stru
 
 
-    def save_struct(self, ip, fname):
-        """save_struct(ip, fname) --> Save structure resulting from fit
-        to file.
+    def save_struct(self, ip, fname, return_string=False):
+        """save_struct(ip, fname, return_string=False) --> Save structure
+        resulting from fit to file.
 
         ip    -- phase to save
+        return_string -- when True, also return contents of the save file
 
         Raises:
             IOError if file cannot be saved
             pdffit2.unassignedError if the data set is undefined
+
+        Returns: string containing contents of save file when
+        return_string is True, otherwise None
         """
-        pdffit2.save_struct(self._handle, ip, fname)
+        structfilestring = pdffit2.save_struct(self._handle, ip, fname)
+        if return_string:
+            return structfilestring
         return
 
 
@@ -509,15 +591,16 @@ class PdfFit(object):
             pdffit2.unassignedError if variable does not yet exist
             ValueError if variable index does not exist (e.g. lat(7))
         """
-        var_ref = self.__getRef(var)
+        handle = self._handle
+        var_ref = self._get_ref(handle, var)
         varnc = _convertCallable(var)
         if fcon:
             fc = self.FCON[fcon]
-            pdffit2.constrain_int(self._handle, var_ref, varnc, par, fc)
+            pdffit2.constrain_int(handle, var_ref, varnc, par, fc)
         elif isinstance(par, six.string_types):
-            pdffit2.constrain_str(self._handle, var_ref, varnc, par)
+            pdffit2.constrain_str(handle, var_ref, varnc, par)
         else:
-            pdffit2.constrain_int(self._handle, var_ref, varnc, par)
+            pdffit2.constrain_int(handle, var_ref, varnc, par)
         return
 
 
@@ -532,12 +615,13 @@ class PdfFit(object):
         # people do not use parenthesis, e.g., "setpar(3, qdamp)"
         # in such case val is a reference to PdfFit method
         val = _convertCallable(val)
+        handle = self._handle
         try:
             val = float(val)
-            pdffit2.setpar_dbl(self._handle, par, val)
+            pdffit2.setpar_dbl(handle, par, val)
         except ValueError:
-            var_ref = self.__getRef(val)
-            pdffit2.setpar_RV(self._handle, par, var_ref)
+            var_ref = self._get_ref(handle, val)
+            pdffit2.setpar_RV(handle, par, var_ref)
         return
 
 
@@ -548,8 +632,31 @@ class PdfFit(object):
             pdffit2.unassignedError if variable does not yet exist
             ValueError if variable index does not exist (e.g. lat(7))
         """
-        var_ref = self.__getRef(var)
-        pdffit2.setvar(self._handle, var_ref, val)
+        handle = self._handle
+        var_ref = self._get_ref(handle, var)
+        pdffit2.setvar(handle, var_ref, val)
+        return
+
+
+    def setvars(self, mapping):
+        """setvars(mapping) --> Set the values of several variables.
+
+        mapping -- dictionary of variable values or a sequence
+                   of (var, val) pairs
+
+        Raises:
+            pdffit2.unassignedError if variable does not yet exist
+            ValueError if variable index does not exist (e.g. lat(7))
+        """
+        items = mapping.items() if hasattr(mapping, 'items') else mapping
+        handle = self._handle
+        get_ref = self._get_ref
+        var_refs = []
+        values = []
+        for var, val in items:
+            var_refs.append(get_ref(handle, var))
+            values.append(val)
+        pdffit2.setvars(handle, var_refs, values)
         return
 
 
@@ -560,8 +667,9 @@ class PdfFit(object):
             pdffit2.unassignedError if variable does not yet exist
             ValueError if variable index does not exist (e.g. lat(7))
         """
-        var_ref = self.__getRef(var)
-        retval = pdffit2.getvar(self._handle, var_ref)
+        handle = self._handle
+        var_ref = self._get_ref(handle, var)
+        retval = pdffit2.getvar(handle, var_ref)
         return retval
 
 
@@ -686,6 +794,26 @@ class PdfFit(object):
         return rv
 
 
+    def get_xyz(self, ip=None):
+        """get_xyz() --> Get fractional coordinates of all atoms in the
+        structure.
+
+        ip -- index of phase to get the coordinates from (starting from 1)
+              when ip is not given, use current phase
+
+        This function should only be called after a structure has been loaded.
+        It is equivalent to, but much faster than, calling getvar for
+        x(i), y(i) and z(i) of every atom.
+
+        Raises: pdffit2.unassignedError if no structure exists
+
+        Returns: List of (x, y, z) tuples in the order of atoms.
+        """
+        if ip is None:  rv = pdffit2.get_xyz(self._handle)
+        else:           rv = pdffit2.get_xyz(self._handle, ip)
+        return rv
+
+
     def getpar(self, par):
         """getpar(par) --> Get value of parameter.
 
@@ -1119,9 +1247,8 @@ class PdfFit(object):
         5 <==> 'beta'
         6 <==> 'gamma'
         """
-        LatParams = { 'a':1, 'b':2, 'c':3, 'alpha':4, 'beta':5, 'gamma':6 }
         if isinstance(n, six.string_types):
-            n = LatParams[n]
+            n = _lat_params[n]
         return "lat(%i)" % n
     lat = staticmethod(lat)
 
@@ -1302,44 +1429,91 @@ class PdfFit(object):
 
     # End refinable variables.
 
+    @property
+    def stru_files(self):
+        """List of structures loaded by read_struct or read_struct_string.
+        """
+        # created on first use
+        if self._stru_files is None:
+            self._stru_files = []
+        return self._stru_files
+
+    @stru_files.setter
+    def stru_files(self, value):
+        self._stru_files = value
+
+
+    @property
+    def data_files(self):
+        """List of data sets loaded by read_data and related methods.
+        """
+        # created on first use
+        if self._data_files is None:
+            self._data_files = []
+        return self._data_files
+
+    @data_files.setter
+    def data_files(self, value):
+        self._data_files = value
+
+
     def __init__(self):
 
-        self.stru_files = []
-        self.data_files = []
+        self._stru_files = None
+        self._data_files = None
 
-        self._handle = pdffit2.create()
+        self._handle = PdfFit._create()
         self.intro()
         return
 
 
-    def __getRef(self, var_string):
+    def _get_ref(handle, var_string):
         """Return the actual reference to the variable in the var_string.
 
+        handle      -- engine handle of the PdfFit instance
+        var_string  -- variable string such as "lat(1)" or a variable
+                       method such as PdfFit.dscale
+
         This function must be called before trying to actually reference an
         internal variable. See the constrain method for an example.
+        The handle is passed explicitly so that callers can look it up
+        only once.
 
         Raises:
             pdffit2.unassignedError if variable is not yet assigned
             ValueError if variable index does not exist (e.g. lat(7))
         """
-        var_string = _convertCallable(var_string)
-        arg_int = None
-        try:
-            method_string, arg_string = var_string.split("(")
-            method_string = method_string.strip()
-            arg_int = int(arg_string.strip(")").strip())
-        except ValueError: #There is no arg_string
-            method_string = var_string.strip()
-
-        f = getattr(pdffit2, method_string)
-        if arg_int is None:
-            retval = f(self._handle)
-        else:
-            retval = f(self._handle, arg_int)
-        return retval
+        # variable names are resolved only once, but the returned
+        # variable pointer must be always obtained from the engine,
+        # because it depends on the current phase and data set.
+        # Scalar variable methods such as PdfFit.dscale are cached too.
+        cache = _ref_cache
+        f = cache.get(var_string)
+        if f is not None:
+            return f(handle)
+        # same as _convertCallable, inlined as this is called very often
+        if callable(var_string):
+            var_string = var_string()
+        head, sep, tail = var_string.partition("(")
+        method_string = head.strip()
+        f = cache.get(method_string)
+        if f is None:
+            f = getattr(pdffit2, method_string)
+            cache[method_string] = f
+        if sep:
+            arg_int = int(tail.rstrip(") ").strip())
+            return f(handle, arg_int)
+        return f(handle)
+    _get_ref = staticmethod(_get_ref)
 
 
 # End of class PdfFit
 
+# resolve references given as scalar variable methods without calling them
+for _n in ('pscale', 'sratio', 'delta1', 'delta2', 'dscale', 'qdamp',
+           'qbroad', 'spdiameter', 'stepcut', 'rcut'):
+    _ref_cache[getattr(PdfFit, _n)] = getattr(pdffit2, _n)
+del _n
+
 
 # End of file
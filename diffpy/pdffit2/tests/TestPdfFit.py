@@ -4,10 +4,13 @@
 """
 
 
+import threading
+import time
 import unittest
 
 from diffpy.structure import loadStructure
 
+import diffpy.pdffit2
 from diffpy.pdffit2 import PdfFit
 from diffpy.pdffit2 import pdffit2
 from diffpy.pdffit2.tests.pdffit2testutils import datafile, capture_output
@@ -36,6 +39,12 @@ class TestPdfFit(unittest.TestCase):
         self.assertIs('N', ns['N'])
         self.assertIs(self.P.lat, ns['lat'])
         self.assertEqual(self.P.reset, ns['reset'])
+        self.assertIs(self.P.data_files, ns['data_files'])
+        self.assertFalse('_handle' in ns)
+        self.assertFalse('_ref_cache' in ns)
+        self.assertFalse('_create' in ns)
+        self.assertFalse('_get_ref' in ns)
+        self.assertFalse('_data_files' in ns)
         return
 
 #   def test_intro(self):
@@ -81,10 +90,50 @@ class TestPdfFit(unittest.TestCase):
         self.assertEqual(0.03, pf.getvar('qdamp'))
         return
 
-#   def test_read_data_lists(self):
-#       """check PdfFit.read_data_lists()
-#       """
-#       return
+    def test_read_many_data(self):
+        """check PdfFit.read_many_data()
+        """
+        pf = self.P
+        files = [datafile('Ni.dat'), datafile('300K.gr')]
+        capture_output(pf.read_many_data, files, 'N', 32, 0.03)
+        self.assertEqual(files, pf.data_files)
+        self.assertEqual(2, pf.num_datasets())
+        self.assertEqual(0.03, pf.getvar('qdamp'))
+        self.assertEqual(2000, len(pf.getpdf_obs()))
+        # files before the failing one stay loaded
+        badfiles = [datafile('Ni.dat'), datafile('nonexistent.dat')]
+        self.assertRaises(IOError, pf.read_many_data, badfiles, 'X', 25, 0)
+        self.assertEqual(3, pf.num_datasets())
+        self.assertEqual(files + badfiles[:1], pf.data_files)
+        # single file name is not split into characters
+        capture_output(pf.read_many_data, datafile('Ni.dat'), 'X', 25, 0)
+        self.assertEqual(4, pf.num_datasets())
+        self.assertEqual(datafile('Ni.dat'), pf.data_files[-1])
+        return
+
+    def test_read_data_lists(self):
+        """check PdfFit.read_data_lists()
+        """
+        import array
+        import numpy
+        r = [0.25 * i for i in range(1, 11)]
+        g = [0.5 * i for i in range(10)]
+        self.P.read_data_lists('X', 25.0, 0.0, tuple(r), numpy.array(g),
+                               array.array('d', len(r) * [1.0]))
+        self.P.read_data_lists('N', 0.0, 0.0, r, g, name='second')
+        self.assertEqual(['list', 'second'], self.P.data_files)
+        for iset in (1, 2):
+            self.P.setdata(iset)
+            self.assertEqual(r, self.P.getR())
+            self.assertEqual(g, self.P.getpdf_obs())
+        self.assertRaises(TypeError, self.P.read_data_lists,
+                          'X', 25.0, 0.0, r, 10 * ['x'])
+        self.assertRaises(TypeError, self.P.read_data_lists,
+                          'X', 25.0, 0.0, r, 1.0)
+        self.assertRaises(pdffit2.dataError, self.P.read_data_lists,
+                          'X', 25.0, 0.0, [], [])
+        return
+
 #
 #   def test_pdfrange(self):
 #       """check PdfFit.pdfrange()
@@ -123,25 +172,113 @@ class TestPdfFit(unittest.TestCase):
         self.assertEqual(Gfit_read_alloc, Gfit_alloc_read)
         return
 
-#   def test_calc(self):
-#       """check PdfFit.calc()
-#       """
-#       return
-#
-#   def test_refine(self):
-#       """check PdfFit.refine()
-#       """
-#       return
+    def test_calc(self):
+        """check PdfFit.calc()
+        """
+        pf = self.P
+        pf.read_struct(datafile('Ni.stru'))
+        pf.alloc('X', 25, 0, 0.1, 30, 600)
+        # engine output is flushed to the python file
+        class RecordingFile(object):
+            writes = flushes = 0
+            def write(self, s):
+                self.writes += 1
+            def flush(self):
+                self.flushes += 1
+        fp = RecordingFile()
+        savestdout = diffpy.pdffit2.output.stdout
+        diffpy.pdffit2.redirect_stdout(fp)
+        try:
+            pf.calc()
+        finally:
+            diffpy.pdffit2.redirect_stdout(savestdout)
+        self.assertTrue(fp.writes > 0)
+        self.assertTrue(fp.flushes > 0)
+        # calc running in other thread must not crash when pf is changed
+        done = threading.Event()
+        def run_calc():
+            while not done.is_set():
+                try:
+                    pf.calc()
+                except (pdffit2.unassignedError, pdffit2.calculationError):
+                    pass
+        thread = threading.Thread(target=run_calc)
+        thread.start()
+        try:
+            for i in range(50):
+                pf.reset()
+                pf.read_struct(datafile('Ni.stru'))
+                pf.alloc('X', 25, 0, 0.1, 30, 600)
+                self.assertEqual(3.52, pf.getvar('lat(1)'))
+                pf.getpdf_fit()
+                # let the other thread start calc
+                time.sleep(0.002)
+        finally:
+            done.set()
+            thread.join()
+        return
+
+    def test_refine(self):
+        """check PdfFit.refine()
+        """
+        self.P.read_data(datafile('Ni.dat'), 'X', 25.0, 0.0)
+        self.P.read_struct(datafile('Ni.stru'))
+        self.P.pdfrange(1, 1.5, 8)
+        self.P.constrain(self.P.lat(1), '@1')
+        self.P.setpar(1, 3.49)
+        steps = []
+        callback = lambda step, finished: steps.append((step, finished))
+        capture_output(self.P.refine, callback=callback)
+        self.assertTrue(len(steps) > 1)
+        self.assertEqual(list(range(1, len(steps) + 1)),
+                         [s for s, f in steps])
+        self.assertEqual([0, 1], sorted(set(f for s, f in steps)))
+        self.assertEqual(1, steps[-1][1])
+        self.assertAlmostEqual(3.52, self.P.getpar(1), 2)
+        # exception raised in the callback aborts the refinement
+        def failing(step, finished):
+            raise RuntimeError("stop")
+        self.P.setpar(1, 3.49)
+        capture_output(self.assertRaises, RuntimeError,
+                       self.P.refine, callback=failing)
+        # refinement after the aborted one starts anew and converges
+        self.P.setpar(1, 3.40)
+        out = capture_output(self.P.refine)
+        self.assertTrue('Starting refinement' in out)
+        self.assertAlmostEqual(3.52, self.P.getpar(1), 2)
+        self.assertRaises(TypeError, self.P.refine, callback=1)
+        return
+
 #
 #   def test_refine_step(self):
 #       """check PdfFit.refine_step()
 #       """
 #       return
 #
-#   def test_save_pdf(self):
-#       """check PdfFit.save_pdf()
-#       """
-#       return
+    def test_save_pdf(self):
+        """check PdfFit.save_pdf()
+        """
+        import os.path
+        import shutil
+        import tempfile
+        self.P.read_struct(datafile('Ni.stru'))
+        self.P.alloc('X', 25.0, 0.0, 1, 5, 41)
+        capture_output(self.P.calc)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'Ni.fgr')
+            self.assertIsNone(self.P.save_pdf(1, fname))
+            with open(fname) as fp:
+                s0 = fp.read()
+            s1 = self.P.save_pdf(1, fname, return_string=True)
+            with open(fname) as fp:
+                self.assertEqual(s1, fp.read())
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(s0, s1)
+        self.assertEqual(s1, self.P.save_pdf_string(1))
+        return
+
 #
 #   def test_save_pdf_string(self):
 #       """check PdfFit.save_pdf_string()
@@ -225,6 +362,23 @@ class TestPdfFit(unittest.TestCase):
         self.assertEqual(1.7, pf.getvar('delta1'))
         return
 
+    def test_setvars(self):
+        """check PdfFit.setvars()
+        """
+        pf = self.P
+        pf.read_struct(datafile('Ni.stru'))
+        pf.setvars({pf.delta1 : 1.2, 'lat(1)' : 3.6, pf.lat('c') : 3.7})
+        self.assertEqual(1.2, pf.getvar(pf.delta1))
+        self.assertEqual(3.6, pf.getvar('lat(1)'))
+        self.assertEqual(3.7, pf.getvar('lat(3)'))
+        pf.setvars([('delta1', 1.7), (pf.x(1), 0.125)])
+        self.assertEqual(1.7, pf.getvar('delta1'))
+        self.assertEqual(0.125, pf.getvar('x(1)'))
+        self.assertRaises(ValueError, pf.setvars, [('lat(7)', 1.0)])
+        self.assertRaises(TypeError, pf.setvars, [('delta1', 'x')])
+        self.assertEqual(1.7, pf.getvar('delta1'))
+        return
+
 #   def test_getvar(self):
 #       """check PdfFit.getvar()
 #       """
@@ -279,6 +433,25 @@ class TestPdfFit(unittest.TestCase):
         self.assertEqual(['PB', 'O', 'SC', 'W', 'TI'], atp2)
         return
 
+    def test_get_xyz(self):
+        """check PdfFit.get_xyz()
+        """
+        self.assertRaises(pdffit2.unassignedError, self.P.get_xyz)
+        self.P.read_struct(datafile('Ni.stru'))
+        self.P.read_struct(datafile('PbScW25TiO3.stru'))
+        self.P.setphase(1)
+        xyz1 = self.P.get_xyz()
+        self.assertEqual(4, len(xyz1))
+        self.assertEqual((0.5, 0.0, 0.5), xyz1[2])
+        xyz2 = self.P.get_xyz(2)
+        self.assertEqual(56, len(xyz2))
+        self.P.setphase(2)
+        for i, (x, y, z) in enumerate(xyz2, 1):
+            self.assertEqual(self.P.getvar(self.P.x(i)), x)
+            self.assertEqual(self.P.getvar(self.P.y(i)), y)
+            self.assertEqual(self.P.getvar(self.P.z(i)), z)
+        return
+
     def test_num_phases(self):
         """check PdfFit.num_phases()
         """
@@ -769,15 +942,51 @@ class TestPdfFit(unittest.TestCase):
 #       """
 #       return
 #
-#   def test___init__(self):
-#       """check PdfFit.__init__()
-#       """
-#       return
-#
-#   def test__PdfFit__getRef(self):
-#       """check PdfFit._PdfFit__getRef()
-#       """
-#       return
+    def test___init__(self):
+        """check PdfFit.__init__()
+        """
+        pf = self.P
+        self.assertEqual([], pf.stru_files)
+        self.assertEqual([], pf.data_files)
+        self.assertFalse(hasattr(pf, '__dict__'))
+        self.assertRaises(AttributeError, setattr, pf, 'nonexistent', 1)
+        self.assertFalse(hasattr(pf, 'finished'))
+        self.assertIs(pf.data_files, pf.data_files)
+        pf.read_struct(datafile('Ni.stru'))
+        self.assertEqual(1, len(pf.stru_files))
+        pf.reset()
+        self.assertEqual([], pf.stru_files)
+        return
+
+    def test__get_ref(self):
+        """check PdfFit._get_ref()
+        """
+        pf = self.P
+        getref = lambda var: pf._get_ref(pf._handle, var)
+        self.assertRaises(pdffit2.unassignedError, getref, 'lat(1)')
+        pf.read_struct(datafile('Ni.stru'))
+        pf.read_struct(datafile('PbScW25TiO3.stru'))
+        # repeated references must follow the current phase
+        for ip, a in ((1, 3.52), (2, 8.0727), (1, 3.52)):
+            pf.setphase(ip)
+            self.assertEqual(a, pf.getvar('lat(1)'))
+            self.assertEqual(a, pf.getvar('lat ( 1)'))
+            self.assertEqual(a, pf.getvar(' lat( 1 ) '))
+            self.assertEqual(a, pf.getvar(pf.lat('a')))
+        self.assertRaises(ValueError, getref, 'lat(7)')
+        self.assertRaises(AttributeError, getref, 'nonexistent')
+        self.assertRaises(AttributeError, getref, 'nonexistent')
+        self.assertRaises(ValueError, getref, 'lat(a)')
+        vref = getref('lat(1)')
+        self.assertEqual(3.52, pdffit2.getvar(pf._handle, vref))
+        # indexed references do not grow the shared cache
+        from diffpy.pdffit2.pdffit import _ref_cache
+        n = len(_ref_cache)
+        for i in range(1, 7):
+            getref('lat(%i)' % i)
+            getref(' lat( %i ) ' % i)
+        self.assertEqual(n, len(_ref_cache))
+        return
 
 # End of class TestPdfFit
 
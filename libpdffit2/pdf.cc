@@ -110,10 +110,11 @@ void DataSet::applyQmaxCutoff(double* y, size_t len)
     size_t padlen = 2*len;
     // MS compatibility fix
     padlen = (size_t)  pow(2.0, ceil(log2(padlen))) ;
-    // ycpad is complex, so it needs to be twice as long
-    valarray<double> ycpad_array(2*padlen);
-    double* ycpad = &(ycpad_array[0]);
-    fill_n(ycpad, 2*padlen, 0.0);
+    // ycpad is complex, so it needs to be twice as long.  The buffer
+    // is kept between calls, which are repeated for every refined variable
+    // over the same grid, so that it is not reallocated each time.
+    qmaxcut_buffer.assign(2*padlen, 0.0);
+    double* ycpad = &(qmaxcut_buffer[0]);
     // copy y to real components of ycpad
     for (size_t i = 0; i != len; ++i)	ycpad[2*i] = y[i];
     // apply fft
@@ -258,12 +259,14 @@ void DataSet::determine(bool ldiff, bool lout, Fit &fit)
 		    (ignore_i[jidx] || ignore_j[iidx]);
 		if (skip)   continue;
 
+		// position difference is the same for all lattice translations
+		const double dpos[3] = { ai.pos[0] - aj.pos[0],
+		    ai.pos[1] - aj.pos[1], ai.pos[2] - aj.pos[2] };
 		for (sph.rewind(); !sph.finished(); sph.next())
 		{
 		    for (int i=0; i<3; i++)
 		    {
-			dd[i] = ai.pos[i] - aj.pos[i] -
-				 sph.mno[i]*phase.icc[i];
+			dd[i] = dpos[i] - sph.mno[i]*phase.icc[i];
 			d[i] = dd[i] * phase.a0[i];
 		    }
 		    dist2 = phase.skalpro(dd,dd);
@@ -338,17 +341,34 @@ void DataSet::determine(bool ldiff, bool lout, Fit &fit)
                     ib = nint((rb-rmin)/deltar);
                     ie = nint((re-rmin)/deltar);
 
-                    for(ig=ib; ig<=ie; ig++)
+                    if (ie >= ib)   totcalc += ie - ib + 1;
+                    // plain Gaussian sum with no branches and no
+                    // pdf_derivative call in the loop.  Loop constants are
+                    // local copies, because stores to ppp could alias the
+                    // data members and prevent vectorization of the loop.
+                    if (!ldiff)
                     {
-                        totcalc++;
-                        rk = rmin + ig*deltar;
-                        rg = rk-dist;
-                        gaus = gnorm * exp(-0.5*sqr(rg/sigma));
-                        ppp[ig] += ampl*gaus;
-
-                        // if derivative are needed
-                        if (ldiff)
+                        const double ag = ampl * gnorm;
+                        const double rg0 = rmin + ib*deltar - dist;
+                        const double dr = deltar;
+                        const double c2 = -0.5/sqr(sigma);
+                        double* pp = &ppp[0] + ib;
+                        const int n = ie - ib + 1;
+                        for (int k = 0; k < n; ++k)
                         {
+                            double rgk = rg0 + k*dr;
+                            pp[k] += ag * exp(c2*sqr(rgk));
+                        }
+                    }
+                    // here derivative are needed
+                    else
+                    {
+                        for(ig=ib; ig<=ie; ig++)
+                        {
+                            rk = rmin + ig*deltar;
+                            rg = rk-dist;
+                            gaus = gnorm * exp(-0.5*sqr(rg/sigma));
+                            ppp[ig] += ampl*gaus;
                             pdf_derivative(phase, ai, aj, rk,
                                     sigma, sigmap, dist, d, ampl, gaus,
                                     fit, fit_a[ig]);
@@ -1432,9 +1452,15 @@ void DataSet::read_data_arrays(int _iset, char tp, double _qmax, double _qdamp,
 
     *pout << " Reading data from arrays...\n";
 
+    if (length < 2)
+    {
+	throw dataError("Incredibly short data set.");
+    }
     rmin = rfmin = r_data[0];
     rmax = rfmax = r_data[length - 1];
     bin = length;
+    nfmin = 0;
+    nfmax = bin - 1;
     deltar = (rmax - rmin)/double(bin-1);
     // check if r has equidistant spacing
     if (!isRegular(r_data, r_data + length))
@@ -1500,11 +1526,15 @@ void DataSet::read_data_stream(int _iset, istream& fdata,
     vector<double> r_data;
     bool lwei = (ncol > 2);     // flag for weights defined by dGr
 
+    // reuse one string stream for all lines, constructing a new stream
+    // with its locale for every data point is much slower.
+    istringstream sline;
     while (true)
     {
         double ri, obs;
         double val, wic;
-        istringstream sline(line);
+        sline.clear();
+        sline.str(line);
 
         sline >> ri >> obs;
 	if (!sline)	break;
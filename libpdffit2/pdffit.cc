@@ -254,7 +254,7 @@ const vector<double>& DataSet::getpdf_fit()
 }
 
 
-vector<double> PdfFit::getpdf_obs()
+const vector<double>& PdfFit::getpdf_obs()
 {
     if (!curset)
     {
@@ -263,7 +263,7 @@ vector<double> PdfFit::getpdf_obs()
     return curset->getpdf_obs();
 }
 
-vector<double> PdfFit::getpdf_fit()
+const vector<double>& PdfFit::getpdf_fit()
 {
     if (!curset)
     {
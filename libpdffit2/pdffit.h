@@ -280,6 +280,12 @@ class PdfFit
 	//
 	int refine(bool deriv, double toler = 0.00000001);
 	int refine_step(bool deriv, double toler = 0.00000001);
+	// discard state of an unfinished refinement so that
+	// the next refine_step starts a new one
+	void refine_reset()
+	{
+	    fit.iter = 0;
+	}
 	double getrw(void)
 	{
 	    return fit.fit_rw;
@@ -352,8 +358,8 @@ class PdfFit
 	vector<PairDistance> bond_length_types(string symi, string symj,
 		double bmin, double bmax);
 
-	vector<double> getpdf_obs();
-	vector<double> getpdf_fit();
+	const vector<double>& getpdf_obs();
+	const vector<double>& getpdf_fit();
 
 	// current phase and set refinable variable pointers
 	vector<RefVar> lat, x, y, z,  u11, u22, u33, u12, u13, u23, occ;
@@ -404,6 +410,8 @@ class DataSet: public Pdf
 	int offset;
         const PdfFit* mowner;
 	void applyQmaxCutoff(double* y, size_t len);
+	// work buffer reused by applyQmaxCutoff for equally sized grids
+	vector<double> qmaxcut_buffer;
 	void extendCalculationRange(bool lout);
 	string selectedAtomsString(int ip, char ijchar);
 	void read_data_stream(int iset, istream& fdata,
@@ -46,6 +46,10 @@ struct PyMethodDef pypdffit2_methods[] = {
     {pypdffit2_read_data__name__, pypdffit2_read_data,
      METH_VARARGS, pypdffit2_read_data__doc__},
 
+    //read_many_data
+    {pypdffit2_read_many_data__name__, pypdffit2_read_many_data,
+     METH_VARARGS, pypdffit2_read_many_data__doc__},
+
     //read_data_string
     {pypdffit2_read_data_string__name__, pypdffit2_read_data_string,
      METH_VARARGS, pypdffit2_read_data_string__doc__},
@@ -118,6 +122,10 @@ struct PyMethodDef pypdffit2_methods[] = {
     {pypdffit2_setvar__name__, pypdffit2_setvar,
      METH_VARARGS, pypdffit2_setvar__doc__},
 
+    //setvars
+    {pypdffit2_setvars__name__, pypdffit2_setvars,
+     METH_VARARGS, pypdffit2_setvars__doc__},
+
     //getvar
     {pypdffit2_getvar__name__, pypdffit2_getvar,
      METH_VARARGS, pypdffit2_getvar__doc__},
@@ -314,6 +322,10 @@ struct PyMethodDef pypdffit2_methods[] = {
     {pypdffit2_get_atom_types__name__, pypdffit2_get_atom_types,
      METH_VARARGS, pypdffit2_get_atom_types__doc__},
 
+    //get_xyz
+    {pypdffit2_get_xyz__name__, pypdffit2_get_xyz,
+     METH_VARARGS, pypdffit2_get_xyz__doc__},
+
     //num_phases
     {pypdffit2_num_phases__name__, pypdffit2_num_phases,
      METH_VARARGS, pypdffit2_num_phases__doc__},
@@ -19,6 +19,7 @@
 ***********************************************************************/
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <pythread.h>
 #include <vector>
 #include <string>
 #include <sstream>
@@ -37,6 +38,125 @@
 // ostream buffer used for engine output redirection
 PyFileStreambuf* py_stdout_streambuf = NULL;
 
+// local helpers for serializing engine calls
+namespace {
+
+// Lock which serializes all calls into the engine.  The engine keeps
+// static data in the constraint parser, least squares minimizer and
+// structure formatting and therefore must run in one thread at a time.
+// The lock is recursive so that a binding can be reentered from python
+// code called while it holds the lock, e.g., from a python destructor.
+PyThread_type_lock engine_lock = NULL;
+unsigned long engine_lock_owner = 0;
+int engine_lock_depth = 0;
+
+// Obtain the engine lock.  When holds_gil is true, the GIL is released
+// while waiting for the lock so that the current owner can finish.
+void acquire_engine_lock(bool holds_gil)
+{
+    unsigned long ident = PyThread_get_thread_ident();
+    if (engine_lock_depth && engine_lock_owner == ident)
+    {
+	++engine_lock_depth;
+	return;
+    }
+    if (!PyThread_acquire_lock(engine_lock, NOWAIT_LOCK))
+    {
+	if (holds_gil)
+	{
+	    Py_BEGIN_ALLOW_THREADS
+	    PyThread_acquire_lock(engine_lock, WAIT_LOCK);
+	    Py_END_ALLOW_THREADS
+	}
+	else
+	{
+	    PyThread_acquire_lock(engine_lock, WAIT_LOCK);
+	}
+    }
+    engine_lock_owner = ident;
+    engine_lock_depth = 1;
+}
+
+void release_engine_lock()
+{
+    if (--engine_lock_depth)  return;
+    engine_lock_owner = 0;
+    PyThread_release_lock(engine_lock);
+}
+
+// Holder of the engine lock for a binding which keeps the GIL.
+// Engine output goes directly to NS_PDFFIT2::pout, because no other
+// thread can redirect it while the lock is held.
+class EngineLockHelper
+{
+    public:
+	// Constructor obtains the engine lock
+	EngineLockHelper()
+	{
+	    if (!engine_lock)  engine_lock = PyThread_allocate_lock();
+	    acquire_engine_lock(true);
+	}
+
+	~EngineLockHelper()
+	{
+	    release_engine_lock();
+	}
+};
+
+// Holder of the engine lock for a binding which runs engine code
+// without holding the GIL.
+class EngineCallHelper
+{
+    private:
+	PyThreadState* thread_state;
+	streambuf* saved_rdbuf;
+	ostringstream msgout;
+
+    public:
+	// Constructor saves thread state, obtains the engine lock and
+	// arranges for holding engine output when redirected
+	EngineCallHelper() : saved_rdbuf(NULL)
+	{
+	    if (!engine_lock)  engine_lock = PyThread_allocate_lock();
+	    thread_state = PyEval_SaveThread();
+	    acquire_engine_lock(false);
+	    if (py_stdout_streambuf)
+	    {
+		saved_rdbuf = NS_PDFFIT2::pout->rdbuf(msgout.rdbuf());
+	    }
+	}
+
+	// restore thread state in case clean() has not been called
+	~EngineCallHelper()
+	{
+	    clean();
+	}
+
+	// method for restoring thread state and writing any outstanding output
+	void clean()
+	{
+	    if (!thread_state)  return;
+	    if (saved_rdbuf)  NS_PDFFIT2::pout->rdbuf(saved_rdbuf);
+	    release_engine_lock();
+	    PyEval_RestoreThread(thread_state);
+	    thread_state = NULL;
+	    // write directly to the python file, because other thread may
+	    // already hold NS_PDFFIT2::pout
+	    const string& msg = msgout.str();
+	    if (saved_rdbuf && !msg.empty())
+	    {
+		// keep any python exception set by the binding
+		PyObject *ptype, *pvalue, *ptraceback;
+		PyErr_Fetch(&ptype, &pvalue, &ptraceback);
+		py_stdout_streambuf->sputn(msg.data(), msg.size());
+		py_stdout_streambuf->pubsync();
+		PyErr_Restore(ptype, pvalue, ptraceback);
+	    }
+	}
+};
+
+}   // local namespace
+
 // copyright
 char pypdffit2_copyright__doc__[] = "";
 char pypdffit2_copyright__name__[] = "copyright";
@@ -53,23 +173,68 @@ PyObject * pypdffit2_copyright(PyObject *, PyObject *)
     return Py_BuildValue("s", pypdffit2_copyright_note);
 }
 
-//helper function to convert a pylist to a double array.
-void double_array_from_pylist(PyObject *pylist, double *d_array, int const length)
+// helper function to convert a python sequence of floats to a double vector.
+// Contiguous buffers of doubles such as numpy arrays are copied directly.
+// Return false and set python exception on failure.
+static bool double_vector_from_pyobject(PyObject* pyobj, vector<double>& dv)
 {
-    //length is the size of the d_array and not necessarily equal to the length
-    //of the pylist
-    PyObject *pyval = 0;
+    Py_buffer view;
+    if (PyObject_CheckBuffer(pyobj) &&
+        PyObject_GetBuffer(pyobj, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == 0)
+    {
+        bool isdouble = view.ndim == 1 && view.itemsize == sizeof(double) &&
+            view.format && string(view.format) == "d";
+        if (isdouble)
+        {
+            const double* first = static_cast<const double*>(view.buf);
+            dv.assign(first, first + view.shape[0]);
+        }
+        PyBuffer_Release(&view);
+        if (isdouble)  return true;
+    }
+    PyErr_Clear();
+    PyObject* pyseq = PySequence_Fast(pyobj, "data must be a sequence of floats");
+    if (!pyseq)  return false;
+    Py_ssize_t length = PySequence_Fast_GET_SIZE(pyseq);
+    PyObject** items = PySequence_Fast_ITEMS(pyseq);
+    dv.resize(length);
+    for (Py_ssize_t i = 0; i < length; ++i)
+    {
+        dv[i] = PyFloat_AsDouble(items[i]);
+        if (dv[i] == -1.0 && PyErr_Occurred())
+        {
+            Py_DECREF(pyseq);
+            return false;
+        }
+    }
+    Py_DECREF(pyseq);
+    return true;
+}
 
-    for(int i = 0; i < length; i++) {
-        pyval = PyList_GetItem(pylist, i);
-        d_array[i] = PyFloat_AsDouble(pyval);
+// helper function to convert a range of doubles to a new python list
+static PyObject* pylist_from_doubles(vector<double>::const_iterator first,
+        vector<double>::const_iterator last)
+{
+    PyObject* pylist = PyList_New(last - first);
+    if (!pylist)  return 0;
+    for (Py_ssize_t i = 0; first != last; ++first, ++i)
+    {
+        PyObject* pyval = PyFloat_FromDouble(*first);
+        if (!pyval)
+        {
+            Py_DECREF(pylist);
+            return 0;
+        }
+        PyList_SET_ITEM(pylist, i, pyval);
     }
+    return pylist;
 }
 
 // helper function to delete PdfFit object
 static void deletePdfFit(PyObject* ptr)
 {
     PdfFit *pdf = (PdfFit *)PyCapsule_GetPointer(ptr, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     delete pdf;
     return;
 }
@@ -80,6 +245,7 @@ char pypdffit2_create__name__[] = "create";
 
 PyObject * pypdffit2_create(PyObject *, PyObject *args)
 {
+    EngineLockHelper janitor;   // serializes engine access
     PdfFit *ppdf = new PdfFit();
     PyObject *py_ppdf = PyCapsule_New((void *)ppdf, cnpfit, deletePdfFit);
     return py_ppdf;
@@ -97,25 +263,31 @@ PyObject * pypdffit2_read_struct(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Os", &py_ppdf, &fname);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try {
         ppdf->read_struct(fname);
     }
     catch(structureError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_structureError, e.GetMsg().c_str());
         return 0;
     }
     catch(ValueError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_structureError, e.GetMsg().c_str());
         return 0;
     }
     catch(calculationError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_calculationError, e.GetMsg().c_str());
         return 0;
     }
     catch(IOError e) {
+        janitor.clean();
         PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
         return 0;
     }
+    janitor.clean();
     Py_INCREF(Py_None);
     return Py_None;
 }
@@ -131,21 +303,26 @@ PyObject * pypdffit2_read_struct_string(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Os", &py_ppdf, &buffer);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try {
         ppdf->read_struct_string(buffer);
     }
     catch(structureError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_structureError, e.GetMsg().c_str());
         return 0;
     }
     catch(ValueError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_structureError, e.GetMsg().c_str());
         return 0;
     }
     catch(calculationError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_calculationError, e.GetMsg().c_str());
         return 0;
     }
+    janitor.clean();
     Py_INCREF(Py_None);
     return Py_None;
 }
@@ -164,17 +341,74 @@ PyObject * pypdffit2_read_data(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oscdd", &py_ppdf, &fname, &stype, &qmax, &qdamp);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try {
         ppdf->read_data(fname, stype, qmax, qdamp);
     }
     catch(IOError e) {
+        janitor.clean();
+        PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
+        return 0;
+    }
+    catch(dataError e) {
+        janitor.clean();
+        PyErr_SetString(pypdffit2_dataError, e.GetMsg().c_str());
+        return 0;
+    }
+    janitor.clean();
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+// read_many_data
+char pypdffit2_read_many_data__doc__[] = "Read several data files into memory.";
+char pypdffit2_read_many_data__name__[] = "read_many_data";
+
+PyObject * pypdffit2_read_many_data(PyObject *, PyObject *args)
+{
+    PyObject *py_fnames;
+    char stype;
+    double qmax, qdamp;
+    PyObject *py_ppdf = 0;
+    int ok = PyArg_ParseTuple(args, "OOcdd", &py_ppdf, &py_fnames, &stype, &qmax, &qdamp);
+    if (!ok) return 0;
+    PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    // convert all file names before releasing the GIL
+    PyObject* py_fseq = PySequence_Fast(py_fnames, "expected sequence of file names");
+    if (!py_fseq)  return 0;
+    Py_ssize_t nfiles = PySequence_Fast_GET_SIZE(py_fseq);
+    PyObject** py_items = PySequence_Fast_ITEMS(py_fseq);
+    vector<string> fnames(nfiles);
+    for (Py_ssize_t i = 0; i < nfiles; ++i)
+    {
+        char *fname;
+        if (!PyArg_Parse(py_items[i], "s", &fname))
+        {
+            Py_DECREF(py_fseq);
+            return 0;
+        }
+        fnames[i] = fname;
+    }
+    Py_DECREF(py_fseq);
+    EngineCallHelper janitor;   // takes care of thread an output issues
+    try {
+        vector<string>::const_iterator fn = fnames.begin();
+        for (; fn != fnames.end(); ++fn)
+        {
+            ppdf->read_data(*fn, stype, qmax, qdamp);
+        }
+    }
+    catch(IOError e) {
+        janitor.clean();
         PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
         return 0;
     }
     catch(dataError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_dataError, e.GetMsg().c_str());
         return 0;
     }
+    janitor.clean();
     Py_INCREF(Py_None);
     return Py_None;
 }
@@ -194,18 +428,22 @@ PyObject * pypdffit2_read_data_string(PyObject *, PyObject *args)
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
     string name = c_name ? c_name : "";
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try {
 	string sbuffer(buffer);
         ppdf->read_data_string(sbuffer, stype, qmax, qdamp, name);
     }
     catch(IOError e) {
+        janitor.clean();
         PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
         return 0;
     }
     catch(dataError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_dataError, e.GetMsg().c_str());
         return 0;
     }
+    janitor.clean();
     Py_INCREF(Py_None);
     return Py_None;
 }
@@ -218,11 +456,7 @@ PyObject * pypdffit2_read_data_arrays(PyObject *, PyObject *args)
 {
     char stype;
     double qmax, qdamp;
-    int length;
     char * c_name = NULL;
-    double *r_data = NULL;
-    double *Gr_data = NULL;
-    double *dGr_data = NULL;
     PyObject *py_r_data = Py_None;
     PyObject *py_Gr_data = Py_None;
     PyObject *py_dGr_data = Py_None;
@@ -232,44 +466,38 @@ PyObject * pypdffit2_read_data_arrays(PyObject *, PyObject *args)
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
 
-    length = PyList_Size(py_Gr_data);
+    // create data arrays
+    vector<double> r_data, Gr_data, dGr_data;
+    if (!double_vector_from_pyobject(py_r_data, r_data))  return 0;
+    if (!double_vector_from_pyobject(py_Gr_data, Gr_data))  return 0;
+    if (py_dGr_data != Py_None &&
+        !double_vector_from_pyobject(py_dGr_data, dGr_data))  return 0;
     //quick check that the arrays are all the same length //
-    int r_len = PyList_Size(py_r_data);
-    int dGr_len = length;
-    if(py_dGr_data != Py_None) {
-        dGr_len = PyList_Size(py_dGr_data);
-    }
-    if(r_len != length || dGr_len != length)
+    int length = Gr_data.size();
+    int dGr_len = (py_dGr_data != Py_None) ? int(dGr_data.size()) : length;
+    if(int(r_data.size()) != length || dGr_len != length)
     {
 	string err_string = "Data arrays have different lengths";
 	PyErr_SetString(PyExc_ValueError, err_string.c_str());
 	return 0;
     }
 
-    // create data arrays
-    r_data = new double [length];
-    double_array_from_pylist(py_r_data, r_data, length);
-    Gr_data = new double [length];
-    double_array_from_pylist(py_Gr_data, Gr_data, length);
-    if(py_dGr_data != Py_None) {
-        dGr_data = new double [length];
-        double_array_from_pylist(py_dGr_data, dGr_data, length);
-    }
     string name = c_name;
+    // read_data_arrays creates its own copy of the data
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try {
 	ppdf->read_data_arrays(stype, qmax, qdamp, length,
-		r_data, Gr_data, dGr_data, name);
+		r_data.empty() ? NULL : &r_data[0],
+		Gr_data.empty() ? NULL : &Gr_data[0],
+		dGr_data.empty() ? NULL : &dGr_data[0], name);
     }
     catch(dataError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_dataError, e.GetMsg().c_str());
         return 0;
     }
+    janitor.clean();
 
-    // read_data_arrays creates its own copy of the data, so we must delete our
-    // copies here.
-    delete [] r_data;
-    delete [] Gr_data;
-    if( dGr_data != NULL ) delete [] dGr_data;
     Py_INCREF(Py_None);
     return Py_None;
 }
@@ -286,6 +514,7 @@ PyObject * pypdffit2_pdfrange(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oidd", &py_ppdf, &iset, &rmin, &rmax);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         ppdf->range(iset, rmin, rmax);
     }
@@ -307,6 +536,7 @@ PyObject * pypdffit2_reset(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     ppdf->reset();
     Py_INCREF(Py_None);
     return Py_None;
@@ -325,6 +555,7 @@ PyObject * pypdffit2_alloc(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Ocddddi", &py_ppdf, &stype, &qmax, &qdamp, &rmin, &rmax, &bin);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         ppdf->alloc(stype, qmax, qdamp, rmin, rmax, bin);
     }
@@ -350,99 +581,39 @@ PyObject * pypdffit2_calc(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try {
         ppdf->calc();
     }
     catch (calculationError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_calculationError, e.GetMsg().c_str());
         return 0;
     }
     catch (unassignedError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_unassignedError, e.GetMsg().c_str());
         return 0;
     }
     catch (parseError e) {
+        janitor.clean();
         PyErr_SetString(pypdffit2_constraintError, e.GetMsg().c_str());
         return 0;
     }
+    janitor.clean();
     Py_INCREF(Py_None);
     return Py_None;
 }
 
-// refine
-char pypdffit2_refine__doc__[] = "refine model to pdf data";
-char pypdffit2_refine__name__[] = "refine";
-
-PyObject * pypdffit2_refine(PyObject *, PyObject *args)
-{
-    PyObject *py_ppdf = 0;
-    double toler;
-    int ok = PyArg_ParseTuple(args, "Od", &py_ppdf, &toler);
-    if (!ok) return 0;
-    PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
-    try {
-        ppdf->refine(true, toler);
-    }
-    catch(constraintError e) {
-        PyErr_SetString(pypdffit2_constraintError, e.GetMsg().c_str());
-        return 0;
-    }
-    catch(calculationError e) {
-        PyErr_SetString(pypdffit2_calculationError, e.GetMsg().c_str());
-        return 0;
-    }
-    Py_INCREF(Py_None);
-    return Py_None;
-}
-
-// local helper class for background thread in pypdffit2_refine_step()
+// local helpers for background refinement in pypdffit2_refine_step()
+// and pypdffit2_refine()
 namespace {
 
-class RefineStepHelper
+// Run one refinement step with released GIL.  Return false and set
+// Python exception when the step fails.
+bool run_refine_step(PdfFit* ppdf, double toler, int& finished)
 {
-    private:
-	PyThreadState* thread_state;
-	ostringstream  msgout;
-
-    public:
-	// Constructor saves thread state and arranges for holding
-	// engine output when redirected
-	RefineStepHelper()
-	{
-	    if (py_stdout_streambuf)
-	    {
-		NS_PDFFIT2::pout->rdbuf(msgout.rdbuf());
-	    }
-	    thread_state = PyEval_SaveThread();
-	}
-
-	// method for restoring thread state and writing any outstanding output
-	void clean()
-	{
-	    PyEval_RestoreThread(thread_state);
-	    if (py_stdout_streambuf)
-	    {
-		NS_PDFFIT2::pout->rdbuf(py_stdout_streambuf);
-		*NS_PDFFIT2::pout << msgout.str();
-	    }
-	}
-};
-
-}   // local namespace
-
-// refine_step
-char pypdffit2_refine_step__doc__[] = "Make one step in the refinement process.";
-char pypdffit2_refine_step__name__[] = "refine_step";
-
-PyObject * pypdffit2_refine_step(PyObject *, PyObject *args)
-{
-    PyObject *py_ppdf = 0;
-    double toler;
-    int ok = PyArg_ParseTuple(args, "Od", &py_ppdf, &toler);
-    if (!ok) return 0;
-    PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
-    RefineStepHelper janitor;   // takes care of thread an output issues
-    int finished = 1;
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try {
 	finished = ppdf->refine_step(true, toler);
     }
@@ -450,32 +621,96 @@ PyObject * pypdffit2_refine_step(PyObject *, PyObject *args)
 	// parseError is due to invalid constraint
 	janitor.clean();
 	PyErr_SetString(pypdffit2_constraintError, e.GetMsg().c_str());
-	return 0;
+	return false;
     }
     catch(constraintError e) {
 	janitor.clean();
 	PyErr_SetString(pypdffit2_constraintError, e.GetMsg().c_str());
-	return 0;
+	return false;
     }
     catch(calculationError e) {
 	janitor.clean();
 	PyErr_SetString(pypdffit2_calculationError, e.GetMsg().c_str());
-	return 0;
+	return false;
     }
     catch(unassignedError e) {
 	janitor.clean();
 	PyErr_SetString(pypdffit2_unassignedError, e.GetMsg().c_str());
-	return 0;
+	return false;
     }
     catch(...) {
 	janitor.clean();
-	return 0;
+	return false;
     }
     janitor.clean();
+    return true;
+}
+
+// Discard unfinished refinement so that the next refine starts anew.
+void abort_refine(PdfFit* ppdf)
+{
+    EngineLockHelper janitor;   // serializes engine access
+    ppdf->refine_reset();
+}
+
+}   // local namespace
+
+// refine_step
+char pypdffit2_refine_step__doc__[] = "Make one step in the refinement process.";
+char pypdffit2_refine_step__name__[] = "refine_step";
 
+PyObject * pypdffit2_refine_step(PyObject *, PyObject *args)
+{
+    PyObject *py_ppdf = 0;
+    double toler;
+    int ok = PyArg_ParseTuple(args, "Od", &py_ppdf, &toler);
+    if (!ok) return 0;
+    PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    int finished = 1;
+    if (!run_refine_step(ppdf, toler, finished))  return 0;
     return Py_BuildValue("i", finished);
 }
 
+// refine
+char pypdffit2_refine__doc__[] = "refine model to pdf data, optional "
+    "callback(step, finished) is called after every refinement step";
+char pypdffit2_refine__name__[] = "refine";
+
+PyObject * pypdffit2_refine(PyObject *, PyObject *args)
+{
+    PyObject *py_ppdf = 0;
+    double toler;
+    PyObject *py_callback = Py_None;
+    int ok = PyArg_ParseTuple(args, "Od|O", &py_ppdf, &toler, &py_callback);
+    if (!ok) return 0;
+    if (py_callback != Py_None && !PyCallable_Check(py_callback))
+    {
+        PyErr_SetString(PyExc_TypeError, "callback must be callable or None");
+        return 0;
+    }
+    PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    int finished = 0;
+    for (int step = 1; !finished; ++step)
+    {
+        bool success = run_refine_step(ppdf, toler, finished);
+        if (success && py_callback != Py_None)
+        {
+            PyObject* rv;
+            rv = PyObject_CallFunction(py_callback, "ii", step, finished);
+            success = (rv != NULL);
+            Py_XDECREF(rv);
+        }
+        // allow interruption of a long refinement with Ctrl-C
+        if (!success || PyErr_CheckSignals())
+        {
+            abort_refine(ppdf);
+            return 0;
+        }
+    }
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 // save_pdf
 char pypdffit2_save_pdf__doc__[] = "Save calculated pdf to file";
 char pypdffit2_save_pdf__name__[] = "save_pdf";
@@ -488,23 +723,26 @@ PyObject * pypdffit2_save_pdf(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Ois", &py_ppdf, &iset, &fname);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    string outfilestring;
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try
     {
-        string outfilestring = ppdf->save_pdf(iset, fname);
-        return Py_BuildValue("s", outfilestring.c_str());
+        outfilestring = ppdf->save_pdf(iset, fname);
     }
     catch(IOError e)
     {
+        janitor.clean();
         PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
         return 0;
     }
     catch(unassignedError e)
     {
+        janitor.clean();
         PyErr_SetString(pypdffit2_unassignedError, e.GetMsg().c_str());
         return 0;
     }
-    Py_INCREF(Py_None);
-    return Py_None;
+    janitor.clean();
+    return Py_BuildValue("s", outfilestring.c_str());
 }
 
 // save_dif
@@ -519,23 +757,26 @@ PyObject * pypdffit2_save_dif(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Ois", &py_ppdf, &iset, &fname);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    string outfilestring;
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try
     {
-        string outfilestring = ppdf->save_dif(iset, fname);
-        return Py_BuildValue("s", outfilestring.c_str());
+        outfilestring = ppdf->save_dif(iset, fname);
     }
     catch(IOError e)
     {
+        janitor.clean();
         PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
         return 0;
     }
     catch(unassignedError e)
     {
+        janitor.clean();
         PyErr_SetString(pypdffit2_unassignedError, e.GetMsg().c_str());
         return 0;
     }
-    Py_INCREF(Py_None);
-    return Py_None;
+    janitor.clean();
+    return Py_BuildValue("s", outfilestring.c_str());
 }
 
 // save_res
@@ -549,23 +790,26 @@ PyObject * pypdffit2_save_res(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Os", &py_ppdf, &fname);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    string outfilestring;
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try
     {
-        string outfilestring = ppdf->save_res(fname);
-        return Py_BuildValue("s", outfilestring.c_str());
+        outfilestring = ppdf->save_res(fname);
     }
     catch(IOError e)
     {
+        janitor.clean();
         PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
         return 0;
     }
     catch(unassignedError e)
     {
+        janitor.clean();
         PyErr_SetString(pypdffit2_unassignedError, e.GetMsg().c_str());
         return 0;
     }
-    Py_INCREF(Py_None);
-    return Py_None;
+    janitor.clean();
+    return Py_BuildValue("s", outfilestring.c_str());
 }
 
 // save_struct
@@ -580,23 +824,26 @@ PyObject * pypdffit2_save_struct(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Ois", &py_ppdf, &iset, &fname);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    string outfilestring;
+    EngineCallHelper janitor;   // takes care of thread an output issues
     try
     {
-        string outfilestring = ppdf->save_struct(iset, fname);
-        return Py_BuildValue("s", outfilestring.c_str());
+        outfilestring = ppdf->save_struct(iset, fname);
     }
     catch(IOError e)
     {
+        janitor.clean();
         PyErr_SetString(PyExc_IOError, e.GetMsg().c_str());
         return 0;
     }
     catch(unassignedError e)
     {
+        janitor.clean();
         PyErr_SetString(pypdffit2_unassignedError, e.GetMsg().c_str());
         return 0;
     }
-    Py_INCREF(Py_None);
-    return Py_None;
+    janitor.clean();
+    return Py_BuildValue("s", outfilestring.c_str());
 }
 
 // show_struct
@@ -610,6 +857,7 @@ PyObject * pypdffit2_show_struct(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &ip);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         string outfilestring = ppdf->show_struct(ip);
@@ -637,6 +885,7 @@ PyObject* pypdffit2_constrain_str(PyObject*, PyObject* args)
     int ok = PyArg_ParseTuple(args, "OOss", &py_ppdf, &py_v, &vname, &form);
     if (!ok) return 0;
     PdfFit* ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     RefVar* v = (RefVar *) PyCapsule_GetPointer(py_v, cnvar);
     if (v->type() != "RefVar")
     {
@@ -681,6 +930,7 @@ PyObject* pypdffit2_constrain_int(PyObject*, PyObject* args)
     int ok = PyArg_ParseTuple(args, "OOsi|i", &py_ppdf, &py_v, &vname, &ipar, &ftype);
     if (!ok) return 0;
     PdfFit* ppdf = (PdfFit*) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     RefVar* v = (RefVar*) PyCapsule_GetPointer(py_v, cnvar);
     if (v->type() != "RefVar")
     {
@@ -728,6 +978,7 @@ PyObject * pypdffit2_setpar_dbl(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "OId", &py_ppdf, &n, &val);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->setpar(n, val);
@@ -754,6 +1005,7 @@ PyObject * pypdffit2_setpar_RV(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "OIO", &py_ppdf, &n, &py_v);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     v = (RefVar *) PyCapsule_GetPointer(py_v, cnvar);
     if( v->isAssigned() ) {
         try
@@ -788,6 +1040,7 @@ PyObject * pypdffit2_setvar(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "OOd", &py_ppdf, &py_v, &a);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     v = (NonRefVar *) PyCapsule_GetPointer(py_v, cnvar);
     if( v->isAssigned() ) {
         ppdf->setvar(*v, a);
@@ -801,6 +1054,59 @@ PyObject * pypdffit2_setvar(PyObject *, PyObject *args)
     return Py_None;
 }
 
+// setvars
+char pypdffit2_setvars__doc__[] = "Set sequence of variables to values.";
+char pypdffit2_setvars__name__[] = "setvars";
+
+PyObject * pypdffit2_setvars(PyObject *, PyObject *args)
+{
+    PyObject *py_vars;
+    PyObject *py_values;
+    PyObject *py_ppdf = 0;
+    int ok = PyArg_ParseTuple(args, "OOO", &py_ppdf, &py_vars, &py_values);
+    if (!ok) return 0;
+    PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
+    vector<double> values;
+    if (!double_vector_from_pyobject(py_values, values))  return 0;
+    PyObject* py_vseq = PySequence_Fast(py_vars, "expected sequence of variables");
+    if (!py_vseq)  return 0;
+    Py_ssize_t nvars = PySequence_Fast_GET_SIZE(py_vseq);
+    PyObject** py_items = PySequence_Fast_ITEMS(py_vseq);
+    if (nvars != Py_ssize_t(values.size()))
+    {
+        Py_DECREF(py_vseq);
+        PyErr_SetString(PyExc_ValueError,
+                "Variables and values have different lengths");
+        return 0;
+    }
+    // check all variables before changing any of them
+    vector<NonRefVar*> vars(nvars);
+    for (Py_ssize_t i = 0; i < nvars; ++i)
+    {
+        vars[i] = (NonRefVar *) PyCapsule_GetPointer(py_items[i], cnvar);
+        if (!vars[i])
+        {
+            Py_DECREF(py_vseq);
+            return 0;
+        }
+        if (!vars[i]->isAssigned())
+        {
+            Py_DECREF(py_vseq);
+            string eout = "Must import a structure";
+            PyErr_SetString(pypdffit2_unassignedError, eout.c_str());
+            return 0;
+        }
+    }
+    for (Py_ssize_t i = 0; i < nvars; ++i)
+    {
+        ppdf->setvar(*vars[i], values[i]);
+    }
+    Py_DECREF(py_vseq);
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
 // getvar
 char pypdffit2_getvar__doc__[] = "Get variable value.";
 char pypdffit2_getvar__name__[] = "getvar";
@@ -813,6 +1119,7 @@ PyObject * pypdffit2_getvar(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "OO", &py_ppdf, &py_v);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     v = (NonRefVar *) PyCapsule_GetPointer(py_v, cnvar);
     if(v->isAssigned()) {
         double crval = ppdf->getvar(*v);
@@ -837,16 +1144,11 @@ PyObject * pypdffit2_getcrw(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         vector<double> crw = ppdf->getcrw();
-        PyObject *py_r;
-        py_r = PyList_New(crw.size());
-        for (int i = 0; i != int(crw.size()); ++i)
-        {
-            PyList_SetItem(py_r, i, PyFloat_FromDouble(crw[i]));
-        }
-        return py_r;
+        return pylist_from_doubles(crw.begin(), crw.end());
     }
     catch(unassignedError e)
     {
@@ -865,6 +1167,7 @@ PyObject * pypdffit2_getrw(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     double crval = ppdf->getrw();
     return Py_BuildValue("d", crval);
 }
@@ -879,6 +1182,7 @@ PyObject * pypdffit2_getR(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     /* One should not put functionality in the bindings. However,
      * this function is meant to create a python object from a
      * c-object that does not actually exist. All that is stored
@@ -908,9 +1212,16 @@ PyObject * pypdffit2_getR(PyObject *, PyObject *args)
             len = nfmax + 1;
         }
         py_r = PyList_New(len);
+        if (!py_r)  return 0;
         for (int i=nfmin;i<=nfmax;i++)
         {
-            PyList_SetItem(py_r, i-nfmin, Py_BuildValue("d", i*deltar + rmin));
+            PyObject* py_ri = PyFloat_FromDouble(i*deltar + rmin);
+            if (!py_ri)
+            {
+                Py_DECREF(py_r);
+                return 0;
+            }
+            PyList_SET_ITEM(py_r, i-nfmin, py_ri);
         }
 
         return py_r;
@@ -933,19 +1244,15 @@ PyObject * pypdffit2_getpdf_fit(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     //Return only the data range used in the fit
     try
     {
         int min = ppdf->getnfmin();
         int max = ppdf->getnfmax();
-        int len = max - min + 1;
-        vector<double> v_pdfdata = ppdf->getpdf_fit();
-        PyObject *py_r;
-        py_r = PyList_New(len);
-        for (int i=min;i<=max;i++) {
-            PyList_SetItem(py_r, i-min, Py_BuildValue("d", v_pdfdata[i]));
-        }
-        return py_r;
+        const vector<double>& v_pdfdata = ppdf->getpdf_fit();
+        return pylist_from_doubles(v_pdfdata.begin() + min,
+                v_pdfdata.begin() + max + 1);
     }
     catch(unassignedError e)
     {
@@ -965,19 +1272,15 @@ PyObject * pypdffit2_getpdf_obs(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
-        vector<double> v_pdfdata = ppdf->getpdf_obs();
+        const vector<double>& v_pdfdata = ppdf->getpdf_obs();
         int nfmin = ppdf->getnfmin();
         int nfmax = ppdf->getnfmax();
-        int len = nfmax - nfmin + 1;
         //Return only the data range used in the fit
-        PyObject *py_r;
-        py_r = PyList_New(len);
-        for (int i=nfmin;i<=nfmax;i++) {
-            PyList_SetItem(py_r, i-nfmin, Py_BuildValue("d", v_pdfdata[i]));
-        }
-        return py_r;
+        return pylist_from_doubles(v_pdfdata.begin() + nfmin,
+                v_pdfdata.begin() + nfmax + 1);
     }
     catch(unassignedError e)
     {
@@ -996,19 +1299,26 @@ PyObject * pypdffit2_getpdf_diff(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
-        vector<double> Gobs = ppdf->getpdf_obs();
-        vector<double> Gfit = ppdf->getpdf_fit();
+        const vector<double>& Gobs = ppdf->getpdf_obs();
+        const vector<double>& Gfit = ppdf->getpdf_fit();
         int nfmin = ppdf->getnfmin();
         int nfmax = ppdf->getnfmax();
         int len = nfmax - nfmin + 1;
         //Return only the data range used in the fit
         PyObject *py_r;
         py_r = PyList_New(len);
+        if (!py_r)  return 0;
         for (int i = nfmin; i <= nfmax; i++) {
-            double Gdiff_i = Gobs[i] - Gfit[i];
-            PyList_SetItem(py_r, i-nfmin, Py_BuildValue("d", Gdiff_i));
+            PyObject* py_gdiff = PyFloat_FromDouble(Gobs[i] - Gfit[i]);
+            if (!py_gdiff)
+            {
+                Py_DECREF(py_r);
+                return 0;
+            }
+            PyList_SET_ITEM(py_r, i-nfmin, py_gdiff);
         }
         return py_r;
     }
@@ -1031,6 +1341,7 @@ PyObject * pypdffit2_getpar(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "OI", &py_ppdf, &n);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         double crval = ppdf->getpar(n);
@@ -1054,6 +1365,7 @@ PyObject * pypdffit2_fixpar(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &n);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->fixpar(n);
@@ -1078,6 +1390,7 @@ PyObject * pypdffit2_freepar(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &n);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->freepar(n);
@@ -1102,6 +1415,7 @@ PyObject * pypdffit2_setphase(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &ip);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->setphase(ip);
@@ -1126,6 +1440,7 @@ PyObject * pypdffit2_setdata(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &is);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->setdata(is);
@@ -1150,6 +1465,7 @@ PyObject * pypdffit2_psel(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &ip);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->selphase(ip);
@@ -1175,6 +1491,7 @@ PyObject * pypdffit2_pdesel(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &ip);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->pdesel(ip);
@@ -1203,6 +1520,7 @@ PyObject * pypdffit2_selectAtomType(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oicsb", &py_ppdf, &ip, &ijchar, &smbpat, &select);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->selectAtomType(ip, ijchar, smbpat, select);
@@ -1235,6 +1553,7 @@ PyObject * pypdffit2_selectAtomIndex(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oicib", &py_ppdf, &ip, &ijchar, &aidx1, &select);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->selectAtomIndex(ip, ijchar, aidx1, select);
@@ -1265,6 +1584,7 @@ PyObject * pypdffit2_selectAll(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oic", &py_ppdf, &ip, &ijchar);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->selectAll(ip, ijchar);
@@ -1295,6 +1615,7 @@ PyObject * pypdffit2_selectNone(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oic", &py_ppdf, &ip, &ijchar);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try
     {
         ppdf->selectNone(ip, ijchar);
@@ -1324,6 +1645,7 @@ PyObject * pypdffit2_bond_angle(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oiii", &py_ppdf, &ia, &ja, &ka);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         pair<double,double> angstd = ppdf->bond_angle(ia, ja, ka);
         PyObject* py_tpl;
@@ -1354,6 +1676,7 @@ PyObject * pypdffit2_bond_length_atoms(PyObject *, PyObject *args)
     PairDistance pd;
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
 	pd = ppdf->bond_length_atoms(ia, ja);
         PyObject *py_tpl;
@@ -1398,36 +1721,46 @@ PyObject * pypdffit2_bond_length_types(PyObject *, PyObject *args)
     vector<PairDistance> pdvec;
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
 	pdvec = ppdf->bond_length_types(symi, symj, bmin, bmax);
         int np = pdvec.size();
-        PyObject* py_dij;
-        PyObject* py_ddij;
-        PyObject* py_ij0;
-        PyObject* py_ij1;
-        py_dij = PyList_New(np);
-        py_ddij = PyList_New(np);
-        py_ij0 = PyList_New(np);
-        py_ij1 = PyList_New(np);
-	for (int i = 0; i < np; ++i)
+        PyObject* py_dij = PyList_New(np);
+        PyObject* py_ddij = PyList_New(np);
+        PyObject* py_ij0 = PyList_New(np);
+        PyObject* py_ij1 = PyList_New(np);
+        PyObject* py_rv = PyDict_New();
+        // PyDict_SetItemString does not steal the value references
+        ok = py_dij && py_ddij && py_ij0 && py_ij1 && py_rv &&
+            0 == PyDict_SetItemString(py_rv, "dij", py_dij) &&
+            0 == PyDict_SetItemString(py_rv, "ddij", py_ddij) &&
+            0 == PyDict_SetItemString(py_rv, "ij0", py_ij0) &&
+            0 == PyDict_SetItemString(py_rv, "ij1", py_ij1);
+        Py_XDECREF(py_dij);
+        Py_XDECREF(py_ddij);
+        Py_XDECREF(py_ij0);
+        Py_XDECREF(py_ij1);
+	for (int i = 0; ok && i < np; ++i)
 	{
 	    PairDistance& pd = pdvec[i];
-	    PyObject *py_item;
-            py_item = PyFloat_FromDouble(pd.dij);
-            PyList_SetItem(py_dij, i, py_item);
-            py_item = PyFloat_FromDouble(pd.ddij);
-            PyList_SetItem(py_ddij, i, py_item);
-	    py_item = Py_BuildValue("(i,i)", pd.i - 1, pd.j - 1);
-            PyList_SetItem(py_ij0, i, py_item);
-	    py_item = Py_BuildValue("(i,i)", pd.i, pd.j);
-            PyList_SetItem(py_ij1, i, py_item);
-        }
-        PyObject* py_rv;
-        py_rv = PyDict_New();
-        PyDict_SetItemString(py_rv, "dij", py_dij);
-        PyDict_SetItemString(py_rv, "ddij", py_ddij);
-        PyDict_SetItemString(py_rv, "ij0", py_ij0);
-        PyDict_SetItemString(py_rv, "ij1", py_ij1);
+	    PyObject* py_item[4] = {
+		PyFloat_FromDouble(pd.dij),
+		PyFloat_FromDouble(pd.ddij),
+		Py_BuildValue("(i,i)", pd.i - 1, pd.j - 1),
+		Py_BuildValue("(i,i)", pd.i, pd.j)
+	    };
+	    ok = py_item[0] && py_item[1] && py_item[2] && py_item[3];
+	    // items are valid or NULL, NULLs only make the lists incomplete
+	    PyList_SET_ITEM(py_dij, i, py_item[0]);
+	    PyList_SET_ITEM(py_ddij, i, py_item[1]);
+	    PyList_SET_ITEM(py_ij0, i, py_item[2]);
+	    PyList_SET_ITEM(py_ij1, i, py_item[3]);
+	}
+	if (!ok)
+	{
+	    Py_XDECREF(py_rv);
+	    return 0;
+	}
 	return py_rv;
     }
     catch (ValueError e) {
@@ -1451,6 +1784,7 @@ PyObject * pypdffit2_get_scat_string(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oc", &py_ppdf, &stype);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     string outstring;
     if (!ppdf->curphase)
     {
@@ -1481,6 +1815,7 @@ PyObject * pypdffit2_get_scat(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Ocs", &py_ppdf, &stype, &smbpat);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     double value;
     try {
         value = ppdf->get_scat(stype, smbpat);
@@ -1507,6 +1842,7 @@ PyObject * pypdffit2_set_scat(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Ocsd", &py_ppdf, &stype, &smbpat, &value);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     if (!ppdf->curphase)
     {
         PyErr_SetString(pypdffit2_unassignedError, "phase does not exist");
@@ -1540,6 +1876,7 @@ PyObject * pypdffit2_reset_scat(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Os", &py_ppdf, &smbpat);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     if (!ppdf->curphase)
     {
         PyErr_SetString(pypdffit2_unassignedError, "phase does not exist");
@@ -1589,6 +1926,7 @@ PyObject * pypdffit2_lat(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->lat,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1615,6 +1953,7 @@ PyObject * pypdffit2_x(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->x,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1641,6 +1980,7 @@ PyObject * pypdffit2_y(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->y,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1667,6 +2007,7 @@ PyObject * pypdffit2_z(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->z,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1693,6 +2034,7 @@ PyObject * pypdffit2_u11(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->u11,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1719,6 +2061,7 @@ PyObject * pypdffit2_u22(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->u22,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1745,6 +2088,7 @@ PyObject * pypdffit2_u33(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->u33,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1771,6 +2115,7 @@ PyObject * pypdffit2_u12(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->u12,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1797,6 +2142,7 @@ PyObject * pypdffit2_u13(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->u13,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1823,6 +2169,7 @@ PyObject * pypdffit2_u23(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->u23,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1849,6 +2196,7 @@ PyObject * pypdffit2_occ(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "Oi", &py_ppdf, &i);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     try {
         RefVar *v = getRefVar(ppdf->occ,i);
         PyObject *py_v = PyCapsule_New(v, cnvar, NULL);
@@ -1874,6 +2222,7 @@ PyObject * pypdffit2_pscale(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->pscale), cnvar, NULL);
     return py_v;
 }
@@ -1888,6 +2237,7 @@ PyObject * pypdffit2_spdiameter(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->spdiameter), cnvar, NULL);
     return py_v;
 }
@@ -1902,6 +2252,7 @@ PyObject * pypdffit2_stepcut(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->stepcut), cnvar, NULL);
     return py_v;
 }
@@ -1916,6 +2267,7 @@ PyObject * pypdffit2_sratio(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->sratio), cnvar, NULL);
     return py_v;
 }
@@ -1930,6 +2282,7 @@ PyObject * pypdffit2_delta2(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->delta2), cnvar, NULL);
     return py_v;
 }
@@ -1944,6 +2297,7 @@ PyObject * pypdffit2_delta1(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->delta1), cnvar, NULL);
     return py_v;
 }
@@ -1958,6 +2312,7 @@ PyObject * pypdffit2_dscale(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->dscale), cnvar, NULL);
     return py_v;
 }
@@ -1972,6 +2327,7 @@ PyObject * pypdffit2_qdamp(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->qdamp), cnvar, NULL);
     return py_v;
 }
@@ -1986,6 +2342,7 @@ PyObject * pypdffit2_qbroad(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->qbroad), cnvar, NULL);
     return py_v;
 }
@@ -2000,6 +2357,7 @@ PyObject * pypdffit2_rcut(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     PyObject *py_v = PyCapsule_New(&(ppdf->rcut), cnvar, NULL);
     return py_v;
 }
@@ -2015,6 +2373,7 @@ PyObject * pypdffit2_get_atoms(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O|i", &py_ppdf, &ip);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     Phase* ph;
     try {
 	ph = ppdf->getphase(ip);
@@ -2044,6 +2403,7 @@ PyObject * pypdffit2_num_atoms(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     if (ppdf->curphase)
     {
         retval = (ppdf->curphase)->natoms;
@@ -2067,6 +2427,7 @@ PyObject * pypdffit2_get_atom_types(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O|i", &py_ppdf, &ip);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     Phase* ph;
     try {
 	ph = ppdf->getphase(ip);
@@ -2086,6 +2447,44 @@ PyObject * pypdffit2_get_atom_types(PyObject *, PyObject *args)
 }
 
 
+// get_xyz
+char pypdffit2_get_xyz__doc__[] = "Get fractional coordinates of atoms in the phase.";
+char pypdffit2_get_xyz__name__[] = "get_xyz";
+
+PyObject * pypdffit2_get_xyz(PyObject *, PyObject *args)
+{
+    PyObject *py_ppdf = 0;
+    int ip = 0;
+    int ok = PyArg_ParseTuple(args, "O|i", &py_ppdf, &ip);
+    if (!ok) return 0;
+    PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
+    Phase* ph;
+    try {
+	ph = ppdf->getphase(ip);
+    }
+    catch (unassignedError e) {
+        PyErr_SetString(pypdffit2_unassignedError, e.GetMsg().c_str());
+        return 0;
+    }
+    // Phase ph is defined here
+    PyObject *py_xyz = PyList_New(ph->natoms);
+    if (!py_xyz)  return 0;
+    for (int i = 0; i < ph->natoms; ++i)
+    {
+	const double* pos = ph->atom[i].pos;
+	PyObject* py_pos = Py_BuildValue("(d,d,d)", pos[0], pos[1], pos[2]);
+	if (!py_pos)
+	{
+	    Py_DECREF(py_xyz);
+	    return 0;
+	}
+	PyList_SET_ITEM(py_xyz, i, py_pos);
+    }
+    return py_xyz;
+}
+
+
 // num_phases
 char pypdffit2_num_phases__doc__[] = "Get the number of loaded phases.";
 char pypdffit2_num_phases__name__[] = "num_phases";
@@ -2097,6 +2496,7 @@ PyObject * pypdffit2_num_phases(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     retval = ppdf->num_phases();
     return Py_BuildValue("i", retval);
 }
@@ -2113,6 +2513,7 @@ PyObject * pypdffit2_num_datasets(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     retval = ppdf->num_datasets();
     return Py_BuildValue("i", retval);
 }
@@ -2139,6 +2540,7 @@ PyObject * pypdffit2_phase_fractions(PyObject *, PyObject *args)
     int ok = PyArg_ParseTuple(args, "O", &py_ppdf);
     if (!ok) return 0;
     PdfFit *ppdf = (PdfFit *) PyCapsule_GetPointer(py_ppdf, cnpfit);
+    EngineLockHelper janitor;   // serializes engine access
     map <string, vector<double> > fractions;
     try
     {
@@ -2186,6 +2588,8 @@ PyObject * pypdffit2_redirect_stdout(PyObject *, PyObject *args)
         PyErr_SetString(PyExc_TypeError, "expected file-like argument");
         return 0;
     }
+    // engine output stream must not change during any engine call
+    EngineLockHelper janitor;
     // create py_stdout_streambuf if necessary
     if (!py_stdout_streambuf)
     {
@@ -2211,6 +2615,7 @@ PyObject * pypdffit2_is_element(PyObject *, PyObject *args)
     char *smbpat;
     int ok = PyArg_ParseTuple(args, "s", &smbpat);
     if (!ok) return 0;
+    EngineLockHelper janitor;   // serializes engine access
     const LocalPeriodicTable* lpt = LocalPeriodicTable::instance();
     PyObject *rv = PyBool_FromLong(lpt->has(smbpat));
     return rv;
@@ -51,6 +51,12 @@ extern char pypdffit2_read_data__doc__[];
 extern "C"
 PyObject * pypdffit2_read_data(PyObject *, PyObject *);
 
+// read_many_data
+extern char pypdffit2_read_many_data__name__[];
+extern char pypdffit2_read_many_data__doc__[];
+extern "C"
+PyObject * pypdffit2_read_many_data(PyObject *, PyObject *);
+
 // read_data_string
 extern char pypdffit2_read_data_string__name__[];
 extern char pypdffit2_read_data_string__doc__[];
@@ -159,6 +165,12 @@ extern char pypdffit2_setvar__name__[];
 extern "C"
 PyObject * pypdffit2_setvar(PyObject *, PyObject *);
 
+// setvars
+extern char pypdffit2_setvars__doc__[];
+extern char pypdffit2_setvars__name__[];
+extern "C"
+PyObject * pypdffit2_setvars(PyObject *, PyObject *);
+
 // getvar
 extern char pypdffit2_getvar__doc__[];
 extern char pypdffit2_getvar__name__[];
@@ -453,6 +465,12 @@ extern char pypdffit2_get_atom_types__name__[];
 extern "C"
 PyObject * pypdffit2_get_atom_types(PyObject *, PyObject *);
 
+// get_xyz
+extern char pypdffit2_get_xyz__doc__[];
+extern char pypdffit2_get_xyz__name__[];
+extern "C"
+PyObject * pypdffit2_get_xyz(PyObject *, PyObject *);
+
 // num_phases
 extern char pypdffit2_num_phases__doc__[];
 extern char pypdffit2_num_phases__name__[];